@@ -1,10 +1,147 @@
 import argparse
-from sympy import *
+import math
+import numpy as np
 from datetime import *
 
-parser = argparse.ArgumentParser(
-  prog='retirement_estimator',
-  description='''
+DAYS_PER_YEAR = 365.25
+
+# Computes the worth at each of the given ages, for plotting. Both sides of the piecewise function are computed over all ages, then picked per age.
+def worth_by_ages(ages, worth_0, age_0, working_net, working_inv_return, worth_at_retirement, retired_net, retired_inv_return, retirement_age):
+  return np.where(
+    ages <= retirement_age,
+    worth_0 + (worth_0 + working_net) * np.expm1(working_inv_return*(ages-age_0)),
+    worth_at_retirement + (worth_at_retirement + retired_net) * np.expm1(retired_inv_return*(ages-retirement_age)),
+  )
+
+def estimate(birthdate, net_worth, working_income, working_spending, retirement_age, retired_spending, net_worth_date=None,
+             working_investment_return=0.06, retired_income=0, retired_investment_return=0.04, target_date=None, target_worth=None, output=None):
+  '''
+  Prints the retirement estimates and plots the net worth over time. The arguments mirror the command line options, with dates
+  given as `datetime.date` objects, so this can be called directly without going through argparse. If `output` is given, the
+  chart is saved to that path instead of being displayed.
+  '''
+  worth_0 = net_worth
+  date_0 = net_worth_date if net_worth_date else date.today()
+  working_inv_return = working_investment_return
+  retired_inv_return = retired_investment_return
+
+  age_0 = (date_0 - birthdate).days / DAYS_PER_YEAR
+
+  def age_to_date(age):
+    return birthdate + timedelta(days = age * DAYS_PER_YEAR)
+
+  # The key to this is a differential equation: dy/dt = r*y + a  =>  y = Ae^(rt) - a/r, where A is a constant based on the starting sum, r is the annual return,
+  # and a is the net yearly saving/spending not related to returns on investment.
+  # The first part of this can be derived from the y=Ae^rt continuously compounding interest equation and the intuition behind the "+ a" is that the non-interest slope is constant.
+  # Net yearly saving/spending divided by the return rate, i.e. the a/r term above.
+  # Since A = y_0 + a/r, the curve is evaluated as y_0 + A*(e^(rt) - 1) using expm1, which avoids cancellation for short time spans.
+  working_net = (working_income-working_spending)/working_inv_return
+  retired_net = (retired_income-retired_spending)/retired_inv_return
+
+  def worth_work(age):
+    return worth_0 + (worth_0 + working_net) * math.expm1(working_inv_return*(age-age_0))
+
+  worth_at_retirement = worth_work(retirement_age)
+
+  def worth_ret(age):
+    return worth_at_retirement + (worth_at_retirement + retired_net) * math.expm1(retired_inv_return*(age-retirement_age))
+
+  # Computes the worth at any given age. The piecewise function is necessary to account for the different investment returns during working and retirement years.
+  def worth_by_age(age):
+    return worth_work(age) if age <= retirement_age else worth_ret(age)
+
+  print(f'Est worth at retirement: ${worth_at_retirement:,.0f}')
+  if target_date:
+    target_age = (target_date - birthdate).days / DAYS_PER_YEAR
+    print(f'Est worth on {target_date}: ${worth_by_age(target_age):,.0f}')
+  print('')
+
+  # Computes the age at which the input worth is achieved. Just the inverse of worth_work. Only valid during working years b/c inverting the piecewise can be non-functional.
+  # ln((worth + working_net)/(worth_0 + working_net)) is rewritten as log1p of the relative change so it stays accurate when worth is close to worth_0.
+  # Returns NaN if the worth is never reached while working, which is when the log1p argument is outside its domain.
+  def age_by_worth(worth):
+    if worth_0 + working_net == 0:
+      return math.nan
+    relative_change = (worth - worth_0)/(worth_0 + working_net)
+    if relative_change <= -1:
+      return math.nan
+    return math.log1p(relative_change) / working_inv_return + age_0
+
+  # The retirement "break-even" amount is (retired_spending-retired_income)/retired_inv_return.
+  # So for no retirement income, $20000 in spending and a 6% return, you must have $333,333 to live forever without ever increasing/decreasing.
+  break_even_worth = (retired_spending-retired_income)/retired_inv_return
+  print(f'Break-even amount: ${break_even_worth:,.0f}')
+  break_even_age = age_by_worth(break_even_worth)
+  if math.isnan(break_even_age):
+    print('Est break-even age: not reached while working')
+  else:
+    print(f'Est break-even age: {break_even_age:.2f} / {age_to_date(break_even_age)}')
+  if target_worth:
+    target_age = age_by_worth(target_worth)
+    if math.isnan(target_age):
+      print(f'Est age at ${target_worth:,.0f}: not reached while working')
+    else:
+      print(f'Est age at ${target_worth:,.0f} (if still working): {target_age:.2f} / {age_to_date(target_age)}')
+
+  # Plot worth over time
+  ages = np.linspace(age_0, 100.0, 512)
+  worths = worth_by_ages(ages, worth_0, age_0, working_net, working_inv_return, worth_at_retirement, retired_net, retired_inv_return, retirement_age)
+  if output:
+    # Drawing on a bare Figure renders with Agg, so saving to a file never imports pyplot or probes for an interactive backend.
+    from matplotlib.figure import Figure
+    fig = Figure(layout='tight')
+  else:
+    import matplotlib.pyplot as plt
+    fig = plt.figure(layout='tight')
+  ax = fig.subplots()
+  ax.plot(ages, worths)
+  ax.set_xlim(age_0, 100.0)
+  ax.axhline(0, color='black', linewidth=0.8)
+  ax.set_xlabel('Age (years)')
+  ax.set_ylabel('Net Worth')
+  if output:
+    fig.savefig(output)
+  else:
+    plt.show()
+
+def estimate_batch(age, net_worth, working_income, working_spending, retirement_age, retired_spending,
+                   working_investment_return=0.06, retired_income=0, retired_investment_return=0.04):
+  '''
+  Computes the estimates for many scenarios at once, for sensitivity analyses. Each argument may be a scalar or a NumPy array,
+  and arrays are broadcast against each other. `age` is the current age in years, in place of the birthdate and net worth date.
+
+  Returns a dict of arrays with the `retirement_worth`, `break_even_worth`, and `break_even_age` of each scenario. Like in
+  estimate(), the break-even age comes from the working-years curve and isn't limited to the retirement age, so it is past
+  `retirement_age` if break-even isn't reached before retiring. It is NaN if the working-years curve never reaches it.
+  '''
+  age_0 = np.asarray(age, dtype=float)
+  worth_0 = np.asarray(net_worth, dtype=float)
+  working_inv_return = np.asarray(working_investment_return, dtype=float)
+  retired_inv_return = np.asarray(retired_investment_return, dtype=float)
+
+  # Same closed forms as in estimate()
+  working_net = (np.asarray(working_income, dtype=float) - working_spending)/working_inv_return
+  retirement_worth = worth_0 + (worth_0 + working_net) * np.expm1(working_inv_return*(retirement_age-age_0))
+  break_even_worth = (retired_spending - np.asarray(retired_income, dtype=float))/retired_inv_return
+  with np.errstate(divide='ignore', invalid='ignore'):
+    relative_change = (break_even_worth - worth_0)/(worth_0 + working_net)
+    break_even_age = np.log1p(relative_change) / working_inv_return + age_0
+  # Same domain check as age_by_worth() in estimate()
+  break_even_age = np.where((worth_0 + working_net == 0) | (relative_change <= -1), np.nan, break_even_age)
+
+  # Give every result the full scenario shape, even if it only depends on some of the inputs. The copies are real arrays, not
+  # broadcast views whose elements share memory.
+  shape = np.broadcast_shapes(retirement_worth.shape, break_even_worth.shape, break_even_age.shape)
+  return {
+    'retirement_worth': np.broadcast_to(retirement_worth, shape).copy(),
+    'break_even_worth': np.broadcast_to(break_even_worth, shape).copy(),
+    'break_even_age': np.broadcast_to(break_even_age, shape).copy(),
+  }
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(
+    prog='retirement_estimator',
+    description='''
   Estimates net worth throughout time based on current net worth, income, spending, retirement date, and investment returns.
 
   It will output:
@@ -21,68 +158,20 @@ parser = argparse.ArgumentParser(
   - All non-spent money is assumed to be invested and earns the return rate.
   - Return rates are assumed to be on total net worth, not necessarily assets. If your assets are significantly leveraged with debt, this may cause inaccuracies.
   ''',
-  formatter_class=argparse.RawTextHelpFormatter
-)
-parser.add_argument('-b', '--birthdate', type=str, help='Birthday', required=True)
-parser.add_argument('-w', '--net-worth', type=int, help='Current net worth', required=True)
-parser.add_argument('-wd', '--net-worth-date', type=str, help='Current net worth date. Assumed to be today', required=False)
-parser.add_argument('-wi', '--working-income', type=int, help='Average working income, not including investment returns', required=True)
-parser.add_argument('-wr', '--working-investment-return', type=float, help='Investment return during working years', default=0.06, required=False)
-parser.add_argument('-ws', '--working-spending', type=int, help='Average working spending', required=True)
-parser.add_argument('-r', '--retirement-age', type=float, help='Retirement age in years', required=True)
-parser.add_argument('-ri', '--retired-income', type=int, help='Average retirement income, not including investment returns. Assumed to be 0', default=0, required=False)
-parser.add_argument('-rr', '--retired-investment-return', type=float, help='Investment return during retirement years', default=0.04, required=False)
-parser.add_argument('-rs', '--retired-spending', type=int, help='Average retirement spending', required=True)
-parser.add_argument('-td', '--target-date', type=str, help='If included, a target date for which to print the net worth', required=False)
-parser.add_argument('-tw', '--target-worth', type=int, help='If included, a target worth for which to print the date', required=False)
-args = parser.parse_args()
-
-birthdate = datetime.strptime(args.birthdate, '%Y-%m-%d').date()
-worth_0 = args.net_worth
-date_0 = datetime.strptime(args.net_worth_date, '%Y-%m-%d').date() if args.net_worth_date else date.today()
-working_income = args.working_income
-working_inv_return = args.working_investment_return
-working_spending = args.working_spending
-retirement_age = args.retirement_age
-retired_income = args.retired_income
-retired_inv_return = args.retired_investment_return
-retired_spending = args.retired_spending
-
-age_0 = (date_0 - birthdate) / timedelta(days = 365.25)
-
-def ageToDate(age):
-  return birthdate + timedelta(days = int(age * 365.25))
-
-
-# The key to this is a differential equation: dy/dt = r*y + a  =>  y = Ae^(rt) - a/r, where A is a constant based on the starting sum, r is the annual return,
-# and a is the net yearly saving/spending not related to returns on investment.
-# The first part of this can be derived from the y=Ae^rt continuously compounding interest equation and the intuition behind the "+ a" is that the non-interest slope is constant.
-age = Symbol('age')
-worth_work = (worth_0 + (working_income-working_spending)/working_inv_return) * exp(working_inv_return*(age-age_0)) - (working_income-working_spending)/working_inv_return
-worth_ret = (worth_work.subs(age, retirement_age) + (retired_income-retired_spending)/retired_inv_return) * exp(retired_inv_return*(age-retirement_age)) - (retired_income-retired_spending)/retired_inv_return
-# Computes the worth at any given age. The piecewise function is necessary to account for the different investment returns during working and retirement years.
-worth_by_age = Piecewise((worth_work, age <= retirement_age), (worth_ret, age > retirement_age)) # Don't let it go beneath 0, cause the interest gets weird.
-
-print(f'Est worth at retirement: ${worth_ret.subs(age, retirement_age):,.0f}')
-if args.target_date:
-  targetDate = datetime.strptime(args.target_date, '%Y-%m-%d').date()
-  targetAge = (targetDate - birthdate) / timedelta(days = 365.25)
-  print(f'Est worth on {targetDate}: ${worth_by_age.subs(age, targetAge):,.0f}')
-print('')
-
-worth = Symbol('worth')
-# Computes the age at which the input worth is achieved. Just the inverse of worth_work. Only valid during working years b/c inverting the piecewise can be non-functional.
-age_by_worth = ln((worth + (working_income-working_spending)/working_inv_return)/(worth_0 + (working_income-working_spending)/working_inv_return)) / working_inv_return + age_0
-# The retirement "break-even" amount is -1*(retired_income-retired_spending)/annualReturn.
-# So for no retirement income, $20000 in spending and a 6% return, you must have $333,333 to live forever without ever increasing/decreasing.
-break_even_worth = -1*(retired_income-retired_spending)/retired_inv_return
-print(f'Break-even amount: ${break_even_worth:,.0f}')
-break_even_age = age_by_worth.subs(worth, break_even_worth)
-print(f'Est break-even age: {break_even_age:.2f} / {ageToDate(break_even_age)}')
-if args.target_worth:
-  targetWorth = args.target_worth
-  targetAge = age_by_worth.subs(worth, targetWorth)
-  print(f'Est age at ${targetWorth:,.0f} (if still working): {targetAge:.2f} / {ageToDate(targetAge)}')
-
-# Plot worth over time
-plot(worth_by_age, (age, age_0, 100.0), xlabel='Age (years)', ylabel='Net Worth', axis_center=(age_0, 0))
\ No newline at end of file
+    formatter_class=argparse.RawTextHelpFormatter
+  )
+  parser.add_argument('-b', '--birthdate', type=date.fromisoformat, help='Birthday', required=True)
+  parser.add_argument('-w', '--net-worth', type=int, help='Current net worth', required=True)
+  parser.add_argument('-wd', '--net-worth-date', type=date.fromisoformat, help='Current net worth date. Assumed to be today', required=False)
+  parser.add_argument('-wi', '--working-income', type=int, help='Average working income, not including investment returns', required=True)
+  parser.add_argument('-wr', '--working-investment-return', type=float, help='Investment return during working years', default=0.06, required=False)
+  parser.add_argument('-ws', '--working-spending', type=int, help='Average working spending', required=True)
+  parser.add_argument('-r', '--retirement-age', type=float, help='Retirement age in years', required=True)
+  parser.add_argument('-ri', '--retired-income', type=int, help='Average retirement income, not including investment returns. Assumed to be 0', default=0, required=False)
+  parser.add_argument('-rr', '--retired-investment-return', type=float, help='Investment return during retirement years', default=0.04, required=False)
+  parser.add_argument('-rs', '--retired-spending', type=int, help='Average retirement spending', required=True)
+  parser.add_argument('-td', '--target-date', type=date.fromisoformat, help='If included, a target date for which to print the net worth', required=False)
+  parser.add_argument('-tw', '--target-worth', type=int, help='If included, a target worth for which to print the date', required=False)
+  parser.add_argument('-o', '--output', type=str, help='If included, a file path to save the chart to instead of displaying it', required=False)
+  args = parser.parse_args()
+  estimate(**vars(args))